@@ -1,21 +1,23 @@
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, Input, Output, State, ctx
 import dash_bootstrap_components as dbc
 import time
 import base64
 import io
-from flask import Flask
+from flask import Flask, request, jsonify
 from PIL import Image
 import zipfile
 import PyPDF2
 
 # Import your existing functions
-from helper import extract_text_from_image, load_pdf_documents, split_text_img_documents, split_text_documents, create_vector_store, load_and_search_vector_store, create_rag_chain
+from helper import extract_text_from_image, load_pdf_documents, split_text_img_documents, split_text_documents, create_vector_store, load_and_search_vector_store, create_rag_chain, batch_answer_questions, list_documents, delete_document, replace_document, get_vector_store_version, normalize_question, SingleFlight, AdmissionController, ServerBusyError
 
 from decouple import config
 import os
 import tempfile
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
+from uuid import uuid4
 import base64
 
 from langchain_core.documents import Document
@@ -26,6 +28,29 @@ print(GROQ_API_KEY)
 # Store the vector store path for simplicity
 VECTOR_STORE_DB_NAME = "My_Test_App_Data"
 
+# Encoder backend (torch, onnx, onnx-int8), embedding model and vector storage (flat, fp16, sq8)
+VECTOR_STORE_OPTIONS = {
+    "model_name": config('EMBEDDING_MODEL', default="sentence-transformers/all-mpnet-base-v2"),
+    "encoder_backend": config('EMBEDDING_BACKEND', default="torch"),
+    "index_type": config('VECTOR_INDEX_TYPE', default="flat"),
+}
+
+# Limits for the batch question-answering API
+BATCH_MAX_QUESTIONS = 1000
+BATCH_LLM_CONCURRENCY = 4
+
+# Admission control for chat and batch requests; identical in-flight chat questions share one run
+chat_admission = AdmissionController(
+    max_active=config('CHAT_MAX_ACTIVE', default=4, cast=int),
+    max_queued=config('CHAT_MAX_QUEUED', default=32, cast=int),
+    max_per_client=config('CHAT_MAX_PER_CLIENT', default=2, cast=int),
+    queue_timeout=config('CHAT_QUEUE_TIMEOUT', default=30, cast=float),
+)
+chat_single_flight = SingleFlight()
+# Number of reverse proxies in front of the app whose X-Forwarded-For header is trusted (0 = none)
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=0, cast=int)
+CHAT_BUSY_MESSAGE = "The server is busy right now, please try again in a moment."
+
 # Initialize Flask server
 server = Flask(__name__)
 
@@ -34,6 +59,10 @@ UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 server.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Behind a reverse proxy, take the client address from X-Forwarded-For
+if TRUSTED_PROXY_COUNT > 0:
+    server.wsgi_app = ProxyFix(server.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
 # Initialize Dash app with Flask server
 app = dash.Dash(__name__, server=server, suppress_callback_exceptions=True, url_base_pathname='/', external_stylesheets=[dbc.themes.BOOTSTRAP])
 app.title = "ChatBotApp"
@@ -138,6 +167,19 @@ styles = """
         color: #555;
         margin-top: 15px;
     }
+    .document-actions {
+        display: flex;
+        gap: 10px;
+        margin-top: 10px;
+    }
+    .document-actions button {
+        padding: 8px 16px;
+        background-color: #4CAF50;
+        color: white;
+        border: none;
+        border-radius: 20px;
+        cursor: pointer;
+    }
 </style>
 """
 
@@ -146,6 +188,9 @@ app.index_string = styles + app.index_string
 # Layout of the Dash app
 app.layout = html.Div(
     [
+        # Browser session id used for per-session fairness in admission control
+        dcc.Store(id="session-id", storage_type="session"),
+
         # Top header
         html.Header(
             className="header",
@@ -173,6 +218,21 @@ app.layout = html.Div(
                         ),
                         html.Div(id="upload-status", className="upload-status"),
                         html.Div(id="uploaded-files-list", className="uploaded-files-list"),
+                        html.H2("Documents", style={"textAlign": "center", "marginTop": "20px"}),
+                        dcc.Dropdown(id="document-list", placeholder="Select a document"),
+                        html.Div(
+                            [
+                                html.Button("Delete", id="delete-document-button", n_clicks=0),
+                                dcc.Upload(
+                                    id="replace-document",
+                                    children=html.Button("Replace"),
+                                    multiple=False,
+                                    accept=".pdf,image/*",
+                                ),
+                            ],
+                            className="document-actions",
+                        ),
+                        html.Div(id="document-status", className="upload-status"),
                     ],
                     className="sidebar",  # Left Sidebar class
                 ),
@@ -236,6 +296,21 @@ app.layout = html.Div(
     ],
 )
 
+def load_file_splits(file_path, name, source=None):
+    """Load and split a single PDF or image file into chunks, optionally recording them under `source`."""
+    if name.lower().endswith(".pdf"):
+        splits = split_text_documents(load_pdf_documents(file_path))
+    elif name.lower().endswith((".png", ".jpg", ".jpeg")):
+        text = extract_text_from_image(file_path)
+        splits = split_text_img_documents(Document(page_content=text, metadata={"source": name})) if text.strip() else []
+    else:
+        raise ValueError(f"Unsupported file type: {name}")
+    if source is not None:
+        for doc in splits:
+            doc.metadata["source"] = source
+    return splits
+
+
 # File Processing: Handle file uploads
 
 @app.callback(
@@ -247,6 +322,9 @@ app.layout = html.Div(
 def handle_file_upload(contents, filenames):
     if contents is not None:
         messages = []
+        errors = False
+        # Chunks of every file in this upload, stored with one vector store update
+        splits = []
         for content, name in zip(contents, filenames):
             try:
                 # Save uploaded file
@@ -255,71 +333,23 @@ def handle_file_upload(contents, filenames):
 
                 # Decode base64 file content
                 content_type, content_string = content.split(',')
-                content_decoded = base64.b64decode(content_string)
                 with open(file_path, "wb") as f:
-                    f.write(content_decoded)
-                    
-                # Debug: Check the file size and path before processing
-                if os.path.exists(file_path):
-                    messages.append(f"{filename} found at {file_path} with size {os.path.getsize(file_path)} bytes.")
-                else:
-                    messages.append(f"{filename} not found at {file_path}.")
+                    f.write(base64.b64decode(content_string))
 
                 # File-specific processing
-                if filename.endswith(".pdf"):
-                    print(file_path, "This is File Path")
-                    print('#'*20)
-                    # load_pdf_documents,
-                    documents = []
-                    pdf_docs = load_pdf_documents(file_path)
-                    documents.extend(pdf_docs)
-                    # Split and store documents in vector DB
-                    try:
-                        splits = split_text_documents(documents)
-                        print(splits, len(splits))
-                        vector_store = create_vector_store(splits)
-                        print(vector_store)
-                        if 'Local db created':
-                            # Display success message
-                            success = True
-                            messages.append(f"File {filename} uploaded and processed successfully.")
-                        else:
-                            success = False
-                            messages.append(f"Error storing documents: {str(e)}")
-                    except Exception as e:
-                        return f"Error storing documents: {str(e)}"
-                    # with open(file_path, "rb") as f:
-                    #     pdf_reader = PyPDF2.PdfReader(f)
-                    #     pdf_text = " ".join([page.extract_text() for page in pdf_reader.pages])
-                
-                elif filename.endswith((".png", ".jpg", ".jpeg")):
-                    # Try to extract text from the image
-                    text = extract_text_from_image(file_path)
-                    
-                    my_doc = Document(page_content=text, metadata={"source": name})
-                    print(type(my_doc))
-                    # Split and store documents in vector DB
-                    try:
-                        splits = split_text_img_documents(my_doc)
-                        print(splits, len(splits))
-                        vector_store = create_vector_store(splits)
-                        print(vector_store)
-                        if 'Local db created':
-                            success = True
-                            # Display success message
-                            messages.append(f"File {filename} uploaded and processed successfully.")
-                        else:
-                            success = False
-                            messages.append(f"Error storing documents: {str(e)}")
-                    except Exception as e:
-                        return f"Error storing documents: {str(e)}"
-                
-                elif filename.endswith(".zip"):
+                if filename.lower().endswith((".pdf", ".png", ".jpg", ".jpeg")):
+                    file_splits = load_file_splits(file_path, filename)
+                    if file_splits:
+                        splits.extend(file_splits)
+                        messages.append(f"File {filename} processed ({len(file_splits)} chunks).")
+                    else:
+                        messages.append(f"No text found in {filename}, skipped.")
+
+                elif filename.lower().endswith(".zip"):
                     try:
-                        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+                        # Extract into a fresh folder so files from earlier uploads are not processed again
+                        with zipfile.ZipFile(file_path, 'r') as zip_ref, tempfile.TemporaryDirectory(dir=server.config['UPLOAD_FOLDER']) as extracted_folder_path:
                             zip_ref.testzip()  # Test the ZIP file for any errors before extracting
-                            extracted_folder_path = os.path.join(server.config['UPLOAD_FOLDER'], "extracted")
-                            os.makedirs(extracted_folder_path, exist_ok=True)
                             zip_ref.extractall(extracted_folder_path)
 
                             for root, dirs, files in os.walk(extracted_folder_path):
@@ -327,73 +357,123 @@ def handle_file_upload(contents, filenames):
                                     if file == ".DS_Store":
                                         continue
 
-                                    file_path = os.path.join(root, file)
+                                    extracted_path = os.path.join(root, file)
+                                    # The path inside the zip keeps same-named files from different folders apart
+                                    relative_path = os.path.relpath(extracted_path, extracted_folder_path).replace(os.sep, "/")
+                                    source = f"{filename}/{relative_path}"
                                     try:
-                                        if file.endswith(".pdf"):
-                                            # load_pdf_documents,
-                                            documents = []
-                                            pdf_docs = load_pdf_documents(file_path)
-                                            documents.extend(pdf_docs)
-                                            # Split and store documents in vector DB
-                                            try:
-                                                splits = split_text_documents(documents)
-                                                print(splits, len(splits))
-                                                vector_store = create_vector_store(splits)
-                                                print(vector_store)
-                                                if 'Local db created':
-                                                    # Display success message
-                                                    success = True
-                                                    messages.append(f"File {filename} uploaded and processed successfully.")
-                                                else:
-                                                    success = False
-                                                    messages.append(f"Error storing documents: {str(e)}")
-                                            except Exception as e:
-                                                return f"Error storing documents: {str(e)}"
-                                        elif file.endswith((".png", ".jpg", ".jpeg")):
-                                            
-                                            # Try to extract text from the image
-                                            text = extract_text_from_image(file_path)
-                                            
-                                            my_doc = Document(page_content=text, metadata={"source": name})
-                                            print(type(my_doc))
-                                            # Split and store documents in vector DB
-                                            try:
-                                                splits = split_text_img_documents(my_doc)
-                                                print(splits, len(splits))
-                                                vector_store = create_vector_store(splits)
-                                                print(vector_store)
-                                                if 'Local db created':
-                                                    # Display success message
-                                                    success = True
-                                                    messages.append(f"File {filename} uploaded and processed successfully.")
-                                                else:
-                                                    success = False
-                                                    messages.append(f"Error storing documents: {str(e)}")
-                                            except Exception as e:
-                                                messages.append(f"Error storing documents: {str(e)}")
-                                                return f"Error storing documents: {str(e)}"
+                                        file_splits = load_file_splits(extracted_path, file, source=source)
+                                        if file_splits:
+                                            splits.extend(file_splits)
+                                            messages.append(f"File {source} processed ({len(file_splits)} chunks).")
                                         else:
-                                            messages.append(f"Unsupported file type: {file_path}")
+                                            messages.append(f"No text found in {source}, skipped.")
                                     except Exception as e:
-                                        messages.append(f"Error processing {file_path}: {str(e)}")
-                                        
+                                        errors = True
+                                        messages.append(f"Error processing {source}: {str(e)}")
+
                     except zipfile.BadZipFile:
+                        errors = True
                         messages.append(f"Failed to unzip {filename}: The file is not a valid ZIP archive.")
                     except Exception as e:
+                        errors = True
                         messages.append(f"Error while processing {filename}: {str(e)}")
 
                 else:
-                    messages.append(f"Uploaded {filename}, but it is not a ZIP file.")
+                    errors = True
+                    messages.append(f"Unsupported file type: {filename}")
             except Exception as e:
+                errors = True
                 messages.append(f"Failed to upload {name}: {str(e)}")
-                
+
+        if splits:
+            try:
+                create_vector_store(splits, **VECTOR_STORE_OPTIONS)
+            except Exception as e:
+                errors = True
+                messages.append(f"Error storing documents: {str(e)}")
+
         # Display appropriate status message
-        if success:
-            return "File processing completed successfully!", html.Ul([html.Li(msg) for msg in messages])
-        else:
+        if errors:
             return "File processing completed with some errors.", html.Ul([html.Li(msg) for msg in messages])
+        return "File processing completed successfully!", html.Ul([html.Li(msg) for msg in messages])
 
-    return "Please upload files."
+    return "Please upload files.", None
+
+
+# Document management: list, delete and replace indexed documents
+@app.callback(
+    [Output("document-list", "options"),
+     Output("document-list", "value"),
+     Output("document-status", "children")],
+    [Input("upload-status", "children"),
+     Input("delete-document-button", "n_clicks"),
+     Input("replace-document", "contents")],
+    [State("document-list", "value"),
+     State("replace-document", "filename")],
+)
+def manage_documents(upload_status, delete_clicks, replace_contents, selected_source, replace_filename):
+    status = ""
+    value = selected_source
+    try:
+        if ctx.triggered_id == "delete-document-button" and selected_source:
+            delete_document(VECTOR_STORE_DB_NAME, selected_source)
+            status = f"Deleted {os.path.basename(selected_source)}."
+            value = None
+        elif ctx.triggered_id == "replace-document" and replace_contents:
+            if not selected_source:
+                status = "Select a document to replace first."
+            else:
+                filename = secure_filename(replace_filename)
+                file_path = os.path.join(server.config['UPLOAD_FOLDER'], filename)
+                content_type, content_string = replace_contents.split(',')
+                with open(file_path, "wb") as f:
+                    f.write(base64.b64decode(content_string))
+                splits = load_file_splits(file_path, filename)
+                if not splits:
+                    status = f"No text found in {filename}, nothing replaced."
+                else:
+                    replace_document(VECTOR_STORE_DB_NAME, selected_source, splits)
+                    status = f"Replaced {os.path.basename(selected_source)} with {filename}."
+                    value = splits[0].metadata.get("source")
+    except Exception as e:
+        status = f"Error updating documents: {str(e)}"
+
+    options = [
+        {"label": f"{os.path.basename(source)} ({chunks} chunks)", "value": source}
+        for source, chunks in list_documents(VECTOR_STORE_DB_NAME)
+    ]
+    return options, value, status
+
+
+def get_client_id(session_id=None):
+    """Identify the client for admission fairness: its session id, else its (proxy-corrected) address."""
+    return session_id or request.remote_addr
+
+
+# Give every browser session its own id, kept in sessionStorage across page reloads
+@app.callback(
+    Output("session-id", "data"),
+    Input("session-id", "data"),
+)
+def ensure_session_id(session_id):
+    return session_id or str(uuid4())
+
+
+def answer_chat_question(user_input, session_id=None):
+    """Answer a chat question, sharing one backend run between identical in-flight questions."""
+    key = (normalize_question(user_input), get_vector_store_version(VECTOR_STORE_DB_NAME))
+    client_id = get_client_id(session_id)
+
+    def run():
+        with chat_admission.admit(client_id):
+            return create_rag_chain(GROQ_API_KEY, user_input, VECTOR_STORE_DB_NAME)
+
+    try:
+        return chat_single_flight.do(key, run)
+    except ServerBusyError as e:
+        print(f"Chat request shed: {e}")
+        return CHAT_BUSY_MESSAGE
 
 
 # Callback to handle chat updates
@@ -418,11 +498,12 @@ def handle_file_upload(contents, filenames):
     Input("send_button", "n_clicks"),
     State("user_input", "value"),
     State("conversation", "children"),
+    State("session-id", "data"),
 )
-def update_chat(n_clicks, user_input, conversation):
+def update_chat(n_clicks, user_input, conversation, session_id):
     if n_clicks > 0 and user_input:
         try:
-            bot_response = create_rag_chain(GROQ_API_KEY, user_input, VECTOR_STORE_DB_NAME)
+            bot_response = answer_chat_question(user_input, session_id)
             
             # add styles on bot and user input
             # bot_response = f"Bot: {bot_response}"
@@ -467,6 +548,33 @@ def update_chat(n_clicks, user_input, conversation):
 
 
 
+# REST API: answer a batch of questions without going through the Dash UI
+@server.route("/api/batch_answer", methods=["POST"])
+def batch_answer():
+    payload = request.get_json(silent=True) or {}
+    questions = payload.get("questions")
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({"error": "'questions' must be a non-empty list of non-empty strings."}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} questions are allowed per request."}), 400
+    if get_vector_store_version(VECTOR_STORE_DB_NAME) is None:
+        return jsonify({"error": "No documents have been uploaded yet."}), 404
+    try:
+        # Keyed on the address alone: a client-chosen header could be rotated to claim more slots
+        with chat_admission.admit(get_client_id()):
+            results = batch_answer_questions(GROQ_API_KEY, questions, VECTOR_STORE_DB_NAME, max_concurrency=BATCH_LLM_CONCURRENCY)
+    except ServerBusyError as e:
+        return jsonify({"error": CHAT_BUSY_MESSAGE, "reason": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        print(f"Error answering batch: {e}")
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"results": results})
+
+
+# REST API: queue depth, shed counts and coalesced requests
+@server.route("/api/stats", methods=["GET"])
+def stats():
+    return jsonify({"admission": chat_admission.stats(), "single_flight": chat_single_flight.stats()})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+"""Measure OCR time per image with and without preprocessing and caching.
+
+Runs over a folder of fixture images and reports the average time per image for:
+  - raw:     full-resolution image straight to pytesseract (the previous behaviour)
+  - cold:    `extract_text_from_image` with an empty OCR cache
+  - cached:  `extract_text_from_image` again, served from the OCR cache
+
+Usage:
+    python benchmark_ocr.py path/to/fixture_images
+"""
+import argparse
+import os
+import shutil
+import time
+
+import pytesseract
+from PIL import Image
+
+import helper
+from helper import configure_tesseract, extract_text_from_image
+
+
+def time_per_image(paths, ocr):
+    start = time.perf_counter()
+    for path in paths:
+        ocr(path)
+    return (time.perf_counter() - start) * 1000 / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder")
+    args = parser.parse_args()
+
+    paths = [
+        os.path.join(args.folder, name)
+        for name in sorted(os.listdir(args.folder))
+        if name.lower().endswith((".png", ".jpg", ".jpeg"))
+    ]
+    if not paths:
+        parser.error(f"No .png/.jpg/.jpeg images found in {args.folder}")
+
+    # Use a throwaway cache so earlier runs do not skew the cold numbers
+    helper.OCR_CACHE_DIR = os.path.join(helper.OCR_CACHE_DIR, "benchmark")
+    shutil.rmtree(helper.OCR_CACHE_DIR, ignore_errors=True)
+
+    # Both the raw and the preprocessed passes run the same Tesseract binary
+    configure_tesseract()
+    raw_ms = time_per_image(paths, lambda path: pytesseract.image_to_string(Image.open(path)))
+    cold_ms = time_per_image(paths, extract_text_from_image)
+    cached_ms = time_per_image(paths, extract_text_from_image)
+    shutil.rmtree(helper.OCR_CACHE_DIR, ignore_errors=True)
+
+    print(f"{len(paths)} images")
+    print("| mode | ms per image |")
+    print("|---|---|")
+    print(f"| raw | {raw_ms:.1f} |")
+    print(f"| cold (preprocessed) | {cold_ms:.1f} |")
+    print(f"| cached | {cached_ms:.1f} |")
+
+
+if __name__ == "__main__":
+    main()
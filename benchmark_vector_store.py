@@ -0,0 +1,101 @@
+"""Compare vector storage and encoder options against the default setup.
+
+Builds an index for every combination below from the same PDF chunks and
+reports index size, query-embed latency and recall@k against the default
+`create_vector_store` setup (all-mpnet, PyTorch, float32 flat index).
+
+Quantized indexes here are trained on the whole corpus at once. The app ingests
+one upload at a time and only switches an sq8 store to int8 once it holds
+SQ8_MIN_TRAINING_VECTORS vectors, so these recall figures describe a fully
+ingested corpus, not the incremental ingestion path.
+
+Usage:
+    python benchmark_vector_store.py path/to/file.pdf [more.pdf ...] [--queries queries.txt] [--k 5]
+"""
+import argparse
+import random
+import time
+
+import faiss
+import numpy as np
+
+from helper import (
+    DEFAULT_EMBEDDING_MODEL,
+    SMALL_EMBEDDING_MODEL,
+    build_faiss_index,
+    get_embeddings,
+    load_pdf_documents,
+    split_text_documents,
+)
+
+# (model_name, encoder_backend, index_type); the first entry is the baseline
+CONFIGURATIONS = [
+    (DEFAULT_EMBEDDING_MODEL, "torch", "flat"),
+    (DEFAULT_EMBEDDING_MODEL, "torch", "fp16"),
+    (DEFAULT_EMBEDDING_MODEL, "torch", "sq8"),
+    (DEFAULT_EMBEDDING_MODEL, "onnx-int8", "flat"),
+    (DEFAULT_EMBEDDING_MODEL, "onnx-int8", "sq8"),
+    (SMALL_EMBEDDING_MODEL, "torch", "flat"),
+    (SMALL_EMBEDDING_MODEL, "torch", "sq8"),
+]
+
+
+def load_queries(path, splits, count=50):
+    """Read one query per line, or sample the opening of random chunks."""
+    if path:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+    random.seed(0)
+    sample = random.sample(splits, min(count, len(splits)))
+    return [doc.page_content[:200] for doc in sample]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--queries")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = []
+    for pdf in args.pdfs:
+        documents.extend(load_pdf_documents(pdf))
+    splits = split_text_documents(documents)
+    texts = [doc.page_content for doc in splits]
+    queries = load_queries(args.queries, splits)
+    print(f"{len(splits)} chunks, {len(queries)} queries, k={args.k}\n")
+
+    doc_vectors = {}
+    baseline_ids = None
+    rows = []
+    for model_name, backend, index_type in CONFIGURATIONS:
+        embeddings = get_embeddings(model_name, backend=backend)
+        if (model_name, backend) not in doc_vectors:
+            doc_vectors[(model_name, backend)] = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+        vectors = doc_vectors[(model_name, backend)]
+
+        index = build_faiss_index(vectors.shape[1], index_type)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        index_bytes = len(faiss.serialize_index(index))
+
+        embeddings.embed_query(queries[0])  # warm-up
+        start = time.perf_counter()
+        query_vectors = np.array([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+        embed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        _, ids = index.search(query_vectors, args.k)
+        if baseline_ids is None:
+            baseline_ids = ids
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ids, baseline_ids)])
+        rows.append((model_name.split("/")[-1], backend, index_type, index_bytes / 1024, embed_ms, recall))
+
+    print(f"| model | encoder | index | index size (KiB) | query embed (ms) | recall@{args.k} vs baseline |")
+    print("|---|---|---|---|---|---|")
+    for model, backend, index_type, size_kib, embed_ms, recall in rows:
+        print(f"| {model} | {backend} | {index_type} | {size_kib:.1f} | {embed_ms:.1f} | {recall:.3f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
-from PIL import Image, UnidentifiedImageError
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
 import pytesseract
 import os
+import io
+import hashlib
+import tempfile
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
@@ -12,13 +15,166 @@ from langchain_groq import ChatGroq
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+import json
+import threading
+import time
+import pickle
+import shutil
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+# Smaller CPU-friendly alternative (384 dimensions instead of 768)
+SMALL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Pre-quantized ONNX export shipped in the sentence-transformers model repos
+ONNX_INT8_FILE_NAME = "onnx/model_qint8_avx2.onnx"
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+# flat: float32 vectors, fp16: 2 bytes per dimension, sq8: 1 byte per dimension
+INDEX_TYPES = ("flat", "fp16", "sq8")
+# int8 ranges are learned from the stored vectors, so sq8 stores keep float32 vectors until this many exist
+SQ8_MIN_TRAINING_VECTORS = 256
+VECTOR_STORE_SETTINGS_FILE = "encoder.json"
+# Settings of stores saved before encoder.json existed, and of new stores when no options are given
+DEFAULT_VECTOR_STORE_SETTINGS = {"model_name": DEFAULT_EMBEDDING_MODEL, "encoder_backend": "torch", "index_type": "flat"}
+# Docstore ids of every indexed document, keyed by its `source`
+DOCUMENT_MANIFEST_FILE = "documents.json"
+# Per-document centroid vectors used to pick which documents' chunks a query searches
+COARSE_INDEX_FILE = "coarse.faiss"
+# Number of closest documents whose chunks are searched; smaller corpora search every chunk
+HIERARCHICAL_TOP_DOCUMENTS = 5
 
-def extract_text_from_image(image_path):
-    """Extract text from an image using Tesseract OCR."""
-    image = Image.open(image_path)
+# Versioned vector store layout: <db>/versions/<version>/ holds the files, <db>/CURRENT names the live version
+VECTOR_STORE_POINTER_FILE = "CURRENT"
+VECTOR_STORE_VERSIONS_DIR = "versions"
+VECTOR_STORE_LOCK_FILE = ".lock"
+VECTOR_STORE_KEEP_VERSIONS = 3
+# Readers map the flat/scalar-quantizer codes read-only (faiss >= 1.11) so worker processes share one page-cache copy
+VECTOR_STORE_MMAP_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+# Serializes load/modify/save cycles on the vector store within this process
+_vector_store_write_lock = threading.Lock()
+# Read-only vector stores opened by this process, keyed by store name
+_vector_store_cache = {}
+_vector_store_cache_lock = threading.Lock()
+
+# OCR preprocessing and cache settings
+OCR_CACHE_DIR = os.path.join(tempfile.gettempdir(), "ocr_cache")
+OCR_CACHE_VERSION = "v3"  # bump when preprocessing changes so old results are not reused
+OCR_TARGET_DPI = 300
+OCR_MAX_SIDE = 2500  # longest side in pixels when the image has no usable DPI metadata
+OCR_PROBE_SIDE = 1024  # longest side of the downscaled copy used for the text check
+OCR_PROBE_TILE = 16  # tile size in pixels of that copy
+OCR_MIN_TILE_EDGE_RATIO = 0.02  # an image is treated as textless only if no tile has this fraction of edge pixels
+
+SYSTEM_PROMPT = (
+    "You are an assistant for question-answering tasks. "
+    "Use the following pieces of retrieved context to answer "
+    "the question. If you don't know the answer, say that you "
+    "don't know. Provide the most relevant and direct answer "
+    "based on the retrieved context Focus on accuracy and clarity, "
+    "avoiding unnecessary elaborationand and keep the "
+    "answer concise."
+    "\n\n"
+    "{context}"
+)
+
+
+def normalize_image_for_ocr(image):
+    """Rotate, convert to grayscale and downscale an image to OCR_TARGET_DPI, or to OCR_MAX_SIDE without DPI metadata."""
+    image = ImageOps.exif_transpose(image).convert("L")
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] > 0:
+        scale = OCR_TARGET_DPI / float(dpi[0])
+    else:
+        scale = OCR_MAX_SIDE / max(image.size)
+    if scale < 1:
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+    return image
+
+def image_has_text(gray_image):
+    """Cheaply check whether a grayscale image could contain text.
+
+    Conservative: only images where no tile of a downscaled copy has sharp edges
+    (blank pages, flat colours, smooth gradients) are treated as textless, so a
+    single short line of text on an otherwise empty page still goes to OCR.
+    """
+    probe = gray_image.copy()
+    probe.thumbnail((OCR_PROBE_SIDE, OCR_PROBE_SIDE))
+    if min(probe.size) < 3:
+        # Too thin to judge, let OCR decide
+        return True
+    edges = probe.filter(ImageFilter.FIND_EDGES)
+    # The kernel filter leaves the one-pixel border unfiltered, so drop it
+    edges = edges.crop((1, 1, edges.width - 1, edges.height - 1)).point(lambda p: 255 if p > 64 else 0)
+    # Each pixel of the reduced image is the mean edge value of one tile
+    tile_density = edges.reduce(OCR_PROBE_TILE) if min(edges.size) >= OCR_PROBE_TILE else edges
+    return tile_density.getextrema()[1] / 255.0 >= OCR_MIN_TILE_EDGE_RATIO
+
+def binarize_image(gray_image):
+    """Binarize a grayscale image with Otsu's threshold."""
+    histogram = gray_image.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background, weight_background = 0.0, 0
+    best_threshold, best_variance = 127, 0.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return gray_image.point(lambda p: 255 if p > best_threshold else 0, mode="1")
+
+def configure_tesseract():
+    """Point pytesseract at the Tesseract install."""
     pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-    return pytesseract.image_to_string(image)
+
+def extract_text_from_image(image_path):
+    """Extract text from an image using Tesseract OCR.
+
+    Images are normalized and binarized before OCR, textless images are skipped,
+    and results are cached by image content hash.
+    """
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    cache_path = os.path.join(OCR_CACHE_DIR, f"{OCR_CACHE_VERSION}-{digest}.txt")
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            return f.read()
+
+    image = normalize_image_for_ocr(Image.open(io.BytesIO(image_bytes)))
+    if not image_has_text(image):
+        # Not cached, so a later, better heuristic can still read this image
+        print(f"No text detected in {image_path}, skipping OCR")
+        return ""
+    configure_tesseract()
+    text = pytesseract.image_to_string(binarize_image(image))
+
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, cache_path)
+    return text
 
 def load_pdf_documents(pdf_path):
     """Load documents from a PDF using PyPDFLoader."""
@@ -41,54 +197,361 @@ def split_text_documents(documents, chunk_size=1000, chunk_overlap=200):
     docs = text_splitter.split_documents(documents)
     return docs
 
-def create_vector_store(splits, model_name="sentence-transformers/all-mpnet-base-v2", device='cpu',):
-    """Create a vector store with FAISS and HuggingFace embeddings."""
-    embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': device}, encode_kwargs={'normalize_embeddings': False})
-    index = faiss.IndexFlatL2(len(embeddings.embed_query("Rag App")))
-    vector_store = FAISS(
-        embedding_function=embeddings,
-        index=index,
-        docstore=InMemoryDocstore(),
-        index_to_docstore_id={},
-    )
-    uuids = [str(uuid4()) for _ in range(len(splits))]
-    vector_store.add_documents(documents=splits, ids=uuids)
-    vector_store.save_local("My_Test_App_Data")
+@lru_cache(maxsize=None)
+def get_embeddings(model_name=DEFAULT_EMBEDDING_MODEL, device='cpu', backend="torch"):
+    """Load the HuggingFace embeddings once per process for the given encoder backend."""
+    model_kwargs = {'device': device}
+    if backend == "onnx":
+        model_kwargs["backend"] = "onnx"
+    elif backend == "onnx-int8":
+        model_kwargs["backend"] = "onnx"
+        model_kwargs["model_kwargs"] = {"file_name": ONNX_INT8_FILE_NAME}
+    elif backend != "torch":
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    return HuggingFaceEmbeddings(model_name=model_name, model_kwargs=model_kwargs, encode_kwargs={'normalize_embeddings': False})
+
+def build_faiss_index(dimension, index_type="flat"):
+    """Create an empty FAISS index storing float32, float16 or int8 scalar-quantized vectors."""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "fp16":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+def get_vector_store_version(VECTOR_STORE_DB_NAME):
+    """Return the name of the published vector store version, "legacy" for an unversioned store, or None."""
+    pointer_path = os.path.join(VECTOR_STORE_DB_NAME, VECTOR_STORE_POINTER_FILE)
+    if os.path.exists(pointer_path):
+        with open(pointer_path) as f:
+            return f.read().strip()
+    if os.path.exists(os.path.join(VECTOR_STORE_DB_NAME, "index.faiss")):
+        return "legacy"
+    return None
+
+def get_vector_store_path(VECTOR_STORE_DB_NAME, version=None):
+    """Return the directory holding the files of a vector store version (the current one by default)."""
+    version = version or get_vector_store_version(VECTOR_STORE_DB_NAME)
+    if version is None or version == "legacy":
+        return VECTOR_STORE_DB_NAME
+    return os.path.join(VECTOR_STORE_DB_NAME, VECTOR_STORE_VERSIONS_DIR, version)
+
+@contextmanager
+def vector_store_file_lock(VECTOR_STORE_DB_NAME):
+    """Hold an exclusive lock on the vector store shared by all processes on this machine."""
+    os.makedirs(VECTOR_STORE_DB_NAME, exist_ok=True)
+    with open(os.path.join(VECTOR_STORE_DB_NAME, VECTOR_STORE_LOCK_FILE), "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                # LK_LOCK gives up with OSError after 10 one-second attempts; keep waiting like flock
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def quantize_index_when_ready(vector_store, index_type):
+    """Replace the float32 buffer of an sq8 store with a trained int8 index once it holds enough vectors.
+
+    Positions are kept, so the docstore mapping stays valid.
+    """
+    index = vector_store.index
+    if index_type != "sq8" or isinstance(index, faiss.IndexScalarQuantizer) or index.ntotal < SQ8_MIN_TRAINING_VECTORS:
+        return
+    vectors = index.reconstruct_n(0, index.ntotal)
+    quantized_index = build_faiss_index(index.d, index_type)
+    quantized_index.train(vectors)
+    quantized_index.add(vectors)
+    vector_store.index = quantized_index
+
+def load_vector_store_settings(VECTOR_STORE_DB_NAME, version=None):
+    """Read the encoder and index settings a vector store was built with."""
+    settings = dict(DEFAULT_VECTOR_STORE_SETTINGS)
+    settings_path = os.path.join(get_vector_store_path(VECTOR_STORE_DB_NAME, version), VECTOR_STORE_SETTINGS_FILE)
+    if os.path.exists(settings_path):
+        with open(settings_path) as f:
+            settings.update(json.load(f))
+    return settings
+
+def load_document_manifest(VECTOR_STORE_DB_NAME, vector_store, version=None):
+    """Read the per-source docstore ids of a vector store, rebuilding them from the docstore for older stores."""
+    manifest_path = os.path.join(get_vector_store_path(VECTOR_STORE_DB_NAME, version), DOCUMENT_MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    manifest = {"documents": {}}
+    for docstore_id in vector_store.index_to_docstore_id.values():
+        doc = vector_store.docstore.search(docstore_id)
+        source = doc.metadata.get("source", "Unknown file") if isinstance(doc, Document) else "Unknown file"
+        manifest["documents"].setdefault(source, []).append(docstore_id)
+    return manifest
+
+def get_chunk_positions(vector_store, manifest):
+    """Map each document's `source` to the FAISS index positions of its chunks."""
+    position_by_id = {docstore_id: position for position, docstore_id in vector_store.index_to_docstore_id.items()}
+    return {
+        source: np.array([position_by_id[docstore_id] for docstore_id in ids if docstore_id in position_by_id], dtype=np.int64)
+        for source, ids in manifest["documents"].items()
+    }
+
+def build_coarse_index(vector_store, manifest):
+    """Build the coarse index holding one centroid of chunk vectors per document.
+
+    Row i of the index belongs to manifest["coarse_sources"][i].
+    """
+    coarse_index = faiss.IndexFlatL2(vector_store.index.d)
+    manifest["coarse_sources"] = []
+    for source, positions in get_chunk_positions(vector_store, manifest).items():
+        if len(positions):
+            vectors = np.array([vector_store.index.reconstruct(int(position)) for position in positions], dtype=np.float32)
+            coarse_index.add(vectors.mean(axis=0, keepdims=True))
+            manifest["coarse_sources"].append(source)
+    return coarse_index
+
+def load_coarse_index(VECTOR_STORE_DB_NAME, vector_store, manifest, version=None):
+    """Load the coarse per-document index, building it from the chunk vectors for stores saved without one."""
+    coarse_path = os.path.join(get_vector_store_path(VECTOR_STORE_DB_NAME, version), COARSE_INDEX_FILE)
+    if os.path.exists(coarse_path) and "coarse_sources" in manifest:
+        return faiss.read_index(coarse_path)
+    return build_coarse_index(vector_store, manifest)
+
+def save_vector_store(vector_store, path, settings, manifest, coarse_index=None):
+    """Save the FAISS index, docstore, encoder settings, document manifest and coarse index into a directory."""
+    vector_store.save_local(path)
+    if coarse_index is not None:
+        faiss.write_index(coarse_index, os.path.join(path, COARSE_INDEX_FILE))
+    with open(os.path.join(path, VECTOR_STORE_SETTINGS_FILE), "w") as f:
+        json.dump(settings, f)
+    with open(os.path.join(path, DOCUMENT_MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f)
+
+def publish_vector_store(vector_store, VECTOR_STORE_DB_NAME, settings, manifest, coarse_index=None):
+    """Write the vector store to a new version directory and atomically point CURRENT at it.
+
+    Must be called while holding `vector_store_file_lock`. Readers keep using the previous
+    version until they see the new pointer; old versions beyond VECTOR_STORE_KEEP_VERSIONS are removed.
+    """
+    versions_dir = os.path.join(VECTOR_STORE_DB_NAME, VECTOR_STORE_VERSIONS_DIR)
+    # One zero-padded UTC nanosecond timestamp, so names sort in publication order
+    version = f"{time.time_ns():020d}-{uuid4().hex[:8]}"
+    tmp_path = os.path.join(versions_dir, f".{version}.tmp")
+    save_vector_store(vector_store, tmp_path, settings, manifest, coarse_index)
+    os.rename(tmp_path, os.path.join(versions_dir, version))
+
+    pointer_path = os.path.join(VECTOR_STORE_DB_NAME, VECTOR_STORE_POINTER_FILE)
+    tmp_pointer_path = f"{pointer_path}.{uuid4().hex}.tmp"
+    with open(tmp_pointer_path, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer_path, pointer_path)
+
+    # Version names sort by creation time; on POSIX, readers that still map a removed version keep working
+    old_versions = sorted(name for name in os.listdir(versions_dir) if not name.startswith("."))[:-VECTOR_STORE_KEEP_VERSIONS]
+    for name in old_versions:
+        if name == version:
+            continue
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+    return version
+
+def embed_splits(splits, settings, device='cpu'):
+    """Embed chunk texts with the encoder named in a vector store's settings."""
+    embeddings = get_embeddings(settings["model_name"], device, settings["encoder_backend"])
+    texts = [doc.page_content for doc in splits]
+    return embeddings, texts, np.array(embeddings.embed_documents(texts), dtype=np.float32)
+
+def update_vector_store(VECTOR_STORE_DB_NAME, splits=(), delete_sources=(), model_name=None, device='cpu', encoder_backend=None, index_type=None):
+    """Add chunks and remove whole documents by `source` in one load/save cycle.
+
+    Chunks whose `source` is already indexed replace that document's old chunks, so only
+    the changed document is embedded. Removed chunks are dropped from both the FAISS index
+    and the docstore by `FAISS.delete`. Encoder and index options that are left as None use
+    the existing store's settings (or the defaults for a new store). Options that differ from
+    the settings an existing store was built with raise ValueError, because its vectors would
+    not be comparable; switching requires deleting the store and re-ingesting every document.
+
+    New chunks are embedded before the write locks are taken so other writers are not
+    blocked on the encoder; they are embedded again only if the store's settings changed
+    in the meantime.
+    """
+    options = {"model_name": model_name, "encoder_backend": encoder_backend, "index_type": index_type}
+    requested = {key: value for key, value in options.items() if value is not None}
+
+    def current_settings():
+        if get_vector_store_version(VECTOR_STORE_DB_NAME) is None:
+            return {**DEFAULT_VECTOR_STORE_SETTINGS, **requested}
+        settings = load_vector_store_settings(VECTOR_STORE_DB_NAME)
+        mismatched = [key for key, value in requested.items() if settings[key] != value]
+        if mismatched:
+            saved = ", ".join(f"{key}={settings[key]}" for key in mismatched)
+            configured = ", ".join(f"{key}={requested[key]}" for key in mismatched)
+            raise ValueError(
+                f"The vector store in {VECTOR_STORE_DB_NAME} was built with {saved}, but the configuration asks for {configured}. "
+                f"Delete {VECTOR_STORE_DB_NAME} and upload all documents again to switch."
+            )
+        return settings
+
+    if splits:
+        embedded_with = current_settings()
+        embeddings, texts, vectors = embed_splits(splits, embedded_with, device)
+
+    with _vector_store_write_lock, vector_store_file_lock(VECTOR_STORE_DB_NAME):
+        settings = current_settings()
+        if get_vector_store_version(VECTOR_STORE_DB_NAME) is not None:
+            vector_store = load_vector_store(VECTOR_STORE_DB_NAME, device)
+            manifest = load_document_manifest(VECTOR_STORE_DB_NAME, vector_store)
+            coarse_index = load_coarse_index(VECTOR_STORE_DB_NAME, vector_store, manifest)
+        else:
+            vector_store = None
+            manifest = {"documents": {}, "coarse_sources": []}
+            coarse_index = None
+
+        delete_sources = set(delete_sources) | {doc.metadata.get("source", "Unknown file") for doc in splits}
+        live_ids = set(vector_store.index_to_docstore_id.values()) if vector_store is not None else set()
+        stale_ids = []
+        for source in delete_sources:
+            stale_ids.extend(docstore_id for docstore_id in manifest["documents"].pop(source, []) if docstore_id in live_ids)
+            if source in manifest["coarse_sources"]:
+                row = manifest["coarse_sources"].index(source)
+                coarse_index.remove_ids(np.array([row], dtype=np.int64))
+                manifest["coarse_sources"].pop(row)
+        if stale_ids:
+            vector_store.delete(stale_ids)
+
+        if splits:
+            encoder_keys = ("model_name", "encoder_backend")
+            if any(settings[key] != embedded_with[key] for key in encoder_keys):
+                embeddings, texts, vectors = embed_splits(splits, settings, device)
+            if vector_store is None:
+                vector_store = FAISS(
+                    embedding_function=embeddings,
+                    # sq8 starts as a float32 buffer, see quantize_index_when_ready
+                    index=build_faiss_index(vectors.shape[1], "flat" if settings["index_type"] == "sq8" else settings["index_type"]),
+                    docstore=InMemoryDocstore(),
+                    index_to_docstore_id={},
+                )
+            uuids = [str(uuid4()) for _ in range(len(splits))]
+            vector_store.add_embeddings(
+                text_embeddings=zip(texts, vectors.tolist()),
+                metadatas=[doc.metadata for doc in splits],
+                ids=uuids,
+            )
+            rows_by_source = {}
+            for row, (doc, uuid) in enumerate(zip(splits, uuids)):
+                source = doc.metadata.get("source", "Unknown file")
+                manifest["documents"].setdefault(source, []).append(uuid)
+                rows_by_source.setdefault(source, []).append(row)
+            # Each new document adds one centroid row to the coarse index
+            if coarse_index is None:
+                coarse_index = faiss.IndexFlatL2(vectors.shape[1])
+            for source, rows in rows_by_source.items():
+                coarse_index.add(vectors[rows].mean(axis=0, keepdims=True))
+                manifest["coarse_sources"].append(source)
+            quantize_index_when_ready(vector_store, settings["index_type"])
+
+        if vector_store is None:
+            return None
+        publish_vector_store(vector_store, VECTOR_STORE_DB_NAME, settings, manifest, coarse_index)
+        return vector_store
+
+def create_vector_store(splits, model_name=None, device='cpu', encoder_backend=None, index_type=None, VECTOR_STORE_DB_NAME="My_Test_App_Data"):
+    """Add documents to the vector store with FAISS and HuggingFace embeddings, replacing older versions of the same `source`."""
+    update_vector_store(VECTOR_STORE_DB_NAME, splits, model_name=model_name, device=device, encoder_backend=encoder_backend, index_type=index_type)
     #check local db created or not
-    if os.path.exists("My_Test_App_Data"):
+    if os.path.exists(VECTOR_STORE_DB_NAME):
         print("Local db created")
         return 'Local db created'
     else:
         print("Local db not created")
         return 'Local db not created'
 
+def delete_document(VECTOR_STORE_DB_NAME, source):
+    """Remove every chunk of one document from the vector store."""
+    update_vector_store(VECTOR_STORE_DB_NAME, delete_sources=[source])
+
+def replace_document(VECTOR_STORE_DB_NAME, source, splits):
+    """Replace one document's chunks with new ones without re-embedding the rest of the corpus."""
+    update_vector_store(VECTOR_STORE_DB_NAME, splits, delete_sources=[source])
+
+def list_documents(VECTOR_STORE_DB_NAME):
+    """Return (source, chunk count) for every indexed document."""
+    if get_vector_store_version(VECTOR_STORE_DB_NAME) is None:
+        return []
+    manifest = get_vector_store_entry(VECTOR_STORE_DB_NAME)["manifest"]
+    return sorted((source, len(ids)) for source, ids in manifest["documents"].items())
+
+def load_vector_store(VECTOR_STORE_DB_NAME, device='cpu', version=None, mmap=False):
+    """Load a saved vector store version with the same encoder it was built with.
+
+    With `mmap=True` the FAISS index is opened read-only and memory-mapped and must not be modified.
+    """
+    path = get_vector_store_path(VECTOR_STORE_DB_NAME, version)
+    settings = load_vector_store_settings(VECTOR_STORE_DB_NAME, version)
+    embeddings = get_embeddings(settings["model_name"], device, settings["encoder_backend"])
+    if not mmap:
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    index = faiss.read_index(os.path.join(path, "index.faiss"), VECTOR_STORE_MMAP_FLAGS)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embedding_function=embeddings, index=index, docstore=docstore, index_to_docstore_id=index_to_docstore_id)
+
+def get_vector_store_entry(VECTOR_STORE_DB_NAME, device='cpu'):
+    """Return the current read-only vector store with its manifest and coarse index, reopening it when a new version is published."""
+    version = get_vector_store_version(VECTOR_STORE_DB_NAME)
+    with _vector_store_cache_lock:
+        entry = _vector_store_cache.get(VECTOR_STORE_DB_NAME)
+        if entry is not None and entry["version"] == version:
+            return entry
+        vector_store = load_vector_store(VECTOR_STORE_DB_NAME, device, version=version, mmap=True)
+        manifest = load_document_manifest(VECTOR_STORE_DB_NAME, vector_store, version)
+        entry = {
+            "version": version,
+            "vector_store": vector_store,
+            "manifest": manifest,
+            "coarse_index": load_coarse_index(VECTOR_STORE_DB_NAME, vector_store, manifest, version),
+            "chunk_positions": get_chunk_positions(vector_store, manifest),
+        }
+        _vector_store_cache[VECTOR_STORE_DB_NAME] = entry
+        return entry
+
+class HierarchicalRetriever(BaseRetriever):
+    """Retriever that picks the closest documents first and then searches only their chunks."""
+
+    vector_store_db_name: str
+    k: int = 5
+    top_documents: int = HIERARCHICAL_TOP_DOCUMENTS
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return batch_search_vector_store(self.vector_store_db_name, [query], k=self.k, top_documents=self.top_documents)[0]
+
 def load_and_search_vector_store(VECTOR_STORE_DB_NAME,):
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2", model_kwargs={'device': 'cpu'}, encode_kwargs={'normalize_embeddings': False})
-    vector_store = FAISS.load_local(VECTOR_STORE_DB_NAME, embeddings, allow_dangerous_deserialization=True)
-    retriver = vector_store.as_retriever(search_type="mmr", search_kwargs={"k": 10})
+    retriver = HierarchicalRetriever(vector_store_db_name=VECTOR_STORE_DB_NAME, k=10)
     return retriver
 
-def create_rag_chain(groq_api_key, user_query, VECTOR_STORE_DB_NAME):
-    """Create a retrieval-augmented generation (RAG) chain."""
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2", model_kwargs={'device': 'cpu'}, encode_kwargs={'normalize_embeddings': False})
-    vector_store = FAISS.load_local(VECTOR_STORE_DB_NAME, embeddings, allow_dangerous_deserialization=True)
-    retriver = vector_store.as_retriever(search_type="mmr", search_kwargs={"k": 5})
+def create_question_answer_chain(groq_api_key):
+    """Create the LLM chain that answers a question from already retrieved documents."""
     llm = ChatGroq(groq_api_key=groq_api_key, model_name="llama-3.2-90b-vision-preview")
-    system_prompt = (
-        "You are an assistant for question-answering tasks. "
-        "Use the following pieces of retrieved context to answer "
-        "the question. If you don't know the answer, say that you "
-        "don't know. Provide the most relevant and direct answer "
-        "based on the retrieved context Focus on accuracy and clarity, "
-        "avoiding unnecessary elaborationand and keep the "
-        "answer concise."
-        "\n\n"
-        "{context}"
-    )
     prompt = ChatPromptTemplate.from_messages(
-        [("system", system_prompt), ("human", "{input}")]
+        [("system", SYSTEM_PROMPT), ("human", "{input}")]
     )
-    question_answer_chain = create_stuff_documents_chain(llm, prompt)
+    return create_stuff_documents_chain(llm, prompt)
+
+def create_rag_chain(groq_api_key, user_query, VECTOR_STORE_DB_NAME):
+    """Create a retrieval-augmented generation (RAG) chain."""
+    retriver = HierarchicalRetriever(vector_store_db_name=VECTOR_STORE_DB_NAME, k=5)
+    question_answer_chain = create_question_answer_chain(groq_api_key)
     rag_chain = create_retrieval_chain(retriver, question_answer_chain)
     response = rag_chain.invoke({"input": user_query})
     print(response["answer"])
@@ -107,6 +570,209 @@ def create_rag_chain(groq_api_key, user_query, VECTOR_STORE_DB_NAME):
     answer+= f"\n\n({metadata_info})"
     return answer
 
+def batch_search_vector_store(VECTOR_STORE_DB_NAME, queries, k=5, fetch_k=20, lambda_mult=0.5, top_documents=HIERARCHICAL_TOP_DOCUMENTS):
+    """Embed all queries in one batch and search the vector store in two levels.
+
+    One multi-query search over the coarse index picks the `top_documents` closest documents
+    per query, then only their chunks are scored. Corpora with no more documents than that
+    are searched in full. Candidates are re-ranked per query with MMR.
+    """
+    entry = get_vector_store_entry(VECTOR_STORE_DB_NAME)
+    vector_store = entry["vector_store"]
+    query_vectors = np.array(vector_store.embedding_function.embed_documents(queries), dtype=np.float32)
+    coarse_index = entry["coarse_index"]
+    hierarchical = coarse_index is not None and coarse_index.ntotal > top_documents
+    if hierarchical:
+        _, document_rows = coarse_index.search(query_vectors, top_documents)
+    else:
+        _, indices = vector_store.index.search(query_vectors, fetch_k)
+
+    results = []
+    for i, query_vector in enumerate(query_vectors):
+        if hierarchical:
+            sources = [entry["manifest"]["coarse_sources"][row] for row in document_rows[i] if row != -1]
+            positions = np.concatenate([entry["chunk_positions"][source] for source in sources]) if sources else np.array([], dtype=np.int64)
+            if not len(positions):
+                results.append([])
+                continue
+            vectors = vector_store.index.reconstruct_batch(positions)
+            closest = np.argsort(((vectors - query_vector) ** 2).sum(axis=1))[:fetch_k]
+            candidates = [int(positions[j]) for j in closest]
+            candidate_vectors = vectors[closest]
+        else:
+            candidates = [int(position) for position in indices[i] if position != -1]
+            candidate_vectors = np.array([vector_store.index.reconstruct(position) for position in candidates], dtype=np.float32)
+        if not candidates:
+            results.append([])
+            continue
+        selected = maximal_marginal_relevance(query_vector, candidate_vectors, k=k, lambda_mult=lambda_mult)
+        docs = []
+        for j in selected:
+            doc = vector_store.docstore.search(vector_store.index_to_docstore_id[candidates[j]])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        results.append(docs)
+    return results
+
+def batch_answer_questions(groq_api_key, questions, VECTOR_STORE_DB_NAME, k=5, max_concurrency=4):
+    """Answer a list of questions with one batched retrieval and concurrent LLM calls.
+
+    Returns one result per question, in the same order, with `source`/`page` citations.
+    """
+    contexts = batch_search_vector_store(VECTOR_STORE_DB_NAME, questions, k=k)
+    question_answer_chain = create_question_answer_chain(groq_api_key)
+
+    def answer(question, context):
+        sources = [
+            {"source": doc.metadata.get("source", "Unknown file"), "page": doc.metadata.get("page", "Unknown page")}
+            for doc in context
+        ]
+        try:
+            return {"question": question, "answer": question_answer_chain.invoke({"input": question, "context": context}), "sources": sources}
+        except Exception as e:
+            return {"question": question, "error": str(e), "sources": sources}
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        return list(executor.map(answer, questions, contexts))
+
+def normalize_question(question):
+    """Normalize a question so trivially different spellings of it share one backend run."""
+    return " ".join(question.lower().split())
+
+class ServerBusyError(Exception):
+    """Raised when a request is shed because the server is at capacity."""
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution whose result every caller receives."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced_count = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+            else:
+                self.coalesced_count += 1
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = fn()
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+        return call["result"]
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "coalesced": self.coalesced_count}
+
+class AdmissionController:
+    """Bounded admission for backend work with per-client fairness.
+
+    At most `max_active` requests run at once and at most `max_queued` wait. Each client may
+    hold at most `max_per_client` running or waiting requests, and waiting requests are
+    admitted round-robin across clients. Requests that cannot be queued, or that wait longer
+    than `queue_timeout` seconds, fail fast with ServerBusyError.
+    """
+
+    def __init__(self, max_active=4, max_queued=32, max_per_client=2, queue_timeout=30):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.max_per_client = max_per_client
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._active = 0
+        # Waiting tickets per client; the first client is admitted next
+        self._waiting = OrderedDict()
+        self._per_client = {}
+        self.admitted_count = 0
+        self.shed_count = 0
+
+    @contextmanager
+    def admit(self, client_id):
+        self._acquire(client_id)
+        try:
+            yield
+        finally:
+            self._release(client_id)
+
+    def _queue_depth(self):
+        return sum(len(tickets) for tickets in self._waiting.values())
+
+    def _shed(self, reason):
+        self.shed_count += 1
+        raise ServerBusyError(reason)
+
+    def _acquire(self, client_id):
+        with self._condition:
+            if self._per_client.get(client_id, 0) >= self.max_per_client:
+                self._shed("Too many requests from this client")
+            must_wait = self._active >= self.max_active or bool(self._waiting)
+            if must_wait and self._queue_depth() >= self.max_queued:
+                self._shed("Request queue is full")
+            self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+            if not must_wait:
+                self._active += 1
+                self.admitted_count += 1
+                return
+
+            ticket = {"admitted": False}
+            self._waiting.setdefault(client_id, deque()).append(ticket)
+            deadline = time.monotonic() + self.queue_timeout
+            while not ticket["admitted"]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting[client_id].remove(ticket)
+                    if not self._waiting[client_id]:
+                        del self._waiting[client_id]
+                    self._forget_client(client_id)
+                    self._shed("Timed out waiting in the request queue")
+                self._condition.wait(remaining)
+            self.admitted_count += 1
+
+    def _release(self, client_id):
+        with self._condition:
+            self._forget_client(client_id)
+            self._active -= 1
+            while self._active < self.max_active and self._waiting:
+                # Admit the oldest ticket of the next client, then move that client to the back
+                next_client, tickets = next(iter(self._waiting.items()))
+                del self._waiting[next_client]
+                tickets.popleft()["admitted"] = True
+                if tickets:
+                    self._waiting[next_client] = tickets
+                self._active += 1
+            self._condition.notify_all()
+
+    def _forget_client(self, client_id):
+        self._per_client[client_id] -= 1
+        if not self._per_client[client_id]:
+            del self._per_client[client_id]
+
+    def stats(self):
+        with self._condition:
+            return {
+                "active": self._active,
+                "queue_depth": self._queue_depth(),
+                "admitted": self.admitted_count,
+                "shed": self.shed_count,
+                "max_active": self.max_active,
+                "max_queued": self.max_queued,
+            }
+
 # def main():
 #     image_text = extract_text_from_image('F:\\DevWorkSpace\\WSP-2024\\Mohammad\\data\\img2.png')
 #     # print("Extracted Text:\n", image_text)